@@ -3,7 +3,7 @@ from __future__ import annotations
 from sys import argv
 from typing import cast
 
-from qualia.config import DEBUG, ATTACH_PYCHARM
+from qualia.config import DEBUG, ATTACH_PYCHARM, ENABLE_GIT_SYNC
 from qualia.config import _ENCRYPTION_USED
 
 # from qualia.utils.perf_utils import perf_imports
@@ -42,12 +42,17 @@ def _get_plugin_class() -> object:
 
 def accelerated_import() -> None:
     # TODO: Profile the improvement
+    from threading import Thread
     if _ENCRYPTION_USED:
         def _fernet_importer() -> None:
             import cryptography.fernet  # noqa
 
-        from threading import Thread
         Thread(target=_fernet_importer, name="FernetImporter").start()
+    if ENABLE_GIT_SYNC:
+        def _pid_importer() -> None:
+            import pid  # noqa
+
+        Thread(target=_pid_importer, name="PidImporter").start()
 
 
 # Detect if loaded as plugin or from external script
@@ -1,5 +1,5 @@
 from itertools import chain
-from typing import Union, cast, Iterable, Optional, Dict
+from typing import Union, cast, Iterable, Optional, Dict, Callable, TypeVar
 
 from bloomfilter import BloomFilter
 from bloomfilter.bloomfilter_strategy import MURMUR128_MITZ_32
@@ -13,6 +13,19 @@ from qualia.utils.common_utils import decrypt_lines, encrypt_lines, get_uuid, ch
 from qualia.utils.database_utils import LMDB
 
 
+_T = TypeVar('_T')
+
+
+def _key_ordered_map(get_node_value: Callable[[NodeId], _T], node_ids: list[NodeId]) -> list[_T]:
+    # Key ordered reads to walk the B+tree pages sequentially, results are in the order of node_ids
+    read_order = sorted(range(len(node_ids)), key=node_ids.__getitem__)
+    values = [get_node_value(node_ids[idx]) for idx in read_order]
+    value_positions = [0] * len(node_ids)
+    for position, idx in enumerate(read_order):
+        value_positions[idx] = position
+    return [values[position] for position in value_positions]
+
+
 class _DbUnsynced(LMDB):
     def delete_unsynced_content_children(self, node_id: NodeId) -> None:
         for cursor in (self._cursors.unsynced_content, self._cursors.unsynced_children):
@@ -42,6 +55,9 @@ class _DbContent(_DbUnsynced, LMDB):
         db_value = decrypt_lines(cast(El, db_node_content_lines)) if ENCRYPT_DB else cast(Li, db_node_content_lines)
         return db_value
 
+    def get_nodes_content_lines(self, node_ids: list[NodeId]) -> list[Li]:
+        return _key_ordered_map(self.get_node_content_lines, node_ids)
+
     def set_node_content_lines(self, node_id: NodeId, content_lines: Li, ) -> None:
         LMDB._set_key_val(node_id, encrypt_lines(content_lines) if ENCRYPT_DB else content_lines, self._cursors.content,
                           True)
@@ -68,6 +84,11 @@ class _DbDescendants(_DbUnsynced, LMDB):
             self._set_node_descendants_value(node_descendants, node_id, transposed)
         return node_descendants
 
+    def get_nodes_descendants(self, node_ids: list[NodeId], transposed: bool, discard_invalid: bool) -> list[
+        OrderedSet[NodeId]]:
+        return _key_ordered_map(lambda node_id: self.get_node_descendants(node_id, transposed, discard_invalid),
+                                node_ids)
+
     def _set_node_descendants_value(self, descendant_ids: OrderedSet[NodeId], node_id: NodeId,
                                     transposed: bool) -> None:
         LMDB._set_key_val(node_id, list(descendant_ids),
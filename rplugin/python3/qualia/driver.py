@@ -7,7 +7,7 @@ from typing import Optional, cast, TYPE_CHECKING
 
 from qualia.config import DEBUG
 from qualia.database import Database
-from qualia.models import View, DuplicateNodeException, UncertainNodeChildrenException, Li
+from qualia.models import View, DuplicateNodeException, UncertainNodeChildrenException, Li, LastSync
 from qualia.render import render
 from qualia.services.git import sync_with_git
 from qualia.services.realtime import Realtime
@@ -48,7 +48,10 @@ class PluginDriver(PluginUtils):
                 if switched_buffer:
                     return
 
-                last_sync = self.buffer_last_sync[current_buffer_id]
+                buffer_state = self.buffer_state(current_buffer_id)
+                last_sync = buffer_state.last_sync
+                if last_sync is None:
+                    last_sync = buffer_state.last_sync = LastSync(None)
 
                 t1 = time()
                 del1 = t1 - t0
@@ -71,16 +74,16 @@ class PluginDriver(PluginUtils):
                                         return
                                     setrecursionlimit(getrecursionlimit() * 2)
                     except DuplicateNodeException as exp:
-                        self.handle_duplicate_node(current_buffer, exp)
+                        self.handle_duplicate_node(current_buffer.number, exp)
                     except UncertainNodeChildrenException as exp:
-                        if self.handle_uncertain_node_descendant(current_buffer, exp, last_sync):
+                        if self.handle_uncertain_node_descendant(current_buffer.number, exp, last_sync):
                             continue
                     else:
                         t2 = time()
                         del2 = t2 - t1
                         self.delete_highlights(current_buffer.number)
-                        self.buffer_last_sync[current_buffer_id] = render(root_view, current_buffer, self.nvim, db,
-                                                                  transposed, fold_level)
+                        buffer_state.last_sync = render(root_view, current_buffer, self.nvim, db, transposed,
+                                                        fold_level)
                         print(f"Rendered at {time()}s")
 
                         total = time() - t0
@@ -90,7 +93,7 @@ class PluginDriver(PluginUtils):
                     break
 
             # Might give OSError while debugging with Pycharm
-            self.changedtick[current_buffer_id] = self.nvim.command_output("silent set write | silent update | echo b:changedtick")
+            buffer_state.changedtick = self.nvim.command_output("silent set write | silent update | echo b:changedtick")
             # self.nvim.command(
             #     "echom 'modified' getbufinfo(bufnr())[0].changed bufname() getbufline(bufnr(), 1, '$') b:changedtick | silent set write | silent update")
 
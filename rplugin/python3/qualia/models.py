@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from bisect import insort, bisect_right
 from collections import UserDict
 from dataclasses import dataclass
 from pathlib import Path
 from subprocess import CalledProcessError
-from typing import NewType, Union, Optional, Tuple, Dict, MutableMapping, List, Callable
+from typing import NewType, Union, Optional, Tuple, Dict, MutableMapping, List, Callable, Iterator
 
 from lmdb import Cursor
 from orderedset import OrderedSet
@@ -32,8 +33,17 @@ class DbClient(TypedDict):
     client_name: str
 
 
+class EditorSnapshot(TypedDict):
+    mode: str
+    undotree: dict
+    changedtick: int
+    buffer_number: int
+    buffer_name: str
+
+
 @dataclass
 class View:
+    __slots__ = ('main_id', 'sub_tree', 'transposed')
     main_id: NodeId
     sub_tree: Optional[Tree]
     transposed: bool
@@ -59,6 +69,8 @@ class UncertainNodeChildrenException(Exception):
 
 @dataclass
 class LineInfo:
+    # One per rendered node line
+    __slots__ = ('node_id', 'parent_view', 'nested_level')
     node_id: NodeId
     parent_view: View
     nested_level: int
@@ -72,6 +84,7 @@ class DuplicateNodeException(Exception):
 
 @dataclass
 class NodeData:
+    __slots__ = ('content_lines', 'descendants_ids')
     content_lines: List[str]
     descendants_ids: OrderedSet[NodeId]
 
@@ -93,16 +106,40 @@ class LastSync(UserDict, MutableMapping[NodeId, NodeData]):
         super().__init__()
         self.data: Dict[NodeId, NodeData] = {}
         self.line_info: Dict[int, LineInfo] = {}
+        # Populated line numbers of line_info in ascending order
+        self.sorted_lines: list[int] = []
         self.source_directory = source_directory
 
     def __clear__(self) -> None:
         self.data.clear()
         self.line_info.clear()
+        self.sorted_lines.clear()
+
+    def set_line_info(self, line_num: int, line_info: LineInfo) -> None:
+        if line_num not in self.line_info:
+            if not self.sorted_lines or line_num > self.sorted_lines[-1]:
+                self.sorted_lines.append(line_num)
+            else:
+                insort(self.sorted_lines, line_num)
+        self.line_info[line_num] = line_info
+
+    def reversed_line_infos(self, max_line_num: int) -> Iterator[LineInfo]:
+        # Populated lines at or above max_line_num, nearest first
+        line_info, sorted_lines = self.line_info, self.sorted_lines
+        for idx in range(bisect_right(sorted_lines, max_line_num) - 1, -1, -1):
+            yield line_info[sorted_lines[idx]]
 
     def pop_data(self, node_id: NodeId) -> None:
         self.data.pop(node_id)
 
 
+@dataclass
+class BufferState:
+    last_sync: Optional[LastSync] = None
+    changedtick: int = -1
+    undo_seq: Optional[int] = None
+
+
 JSONType = Union[str, int, float, bool, None, Dict[str, object], List[str], List[object], Li, El]
 NODE_ID_ATTR = "node_id"
 
@@ -142,6 +179,10 @@ class MinimalDb(ABC):
     def get_node_content_lines(self, node_id: NodeId) -> Li:
         pass
 
+    @abstractmethod
+    def is_valid_node(self, node_id: NodeId) -> bool:
+        pass
+
     @abstractmethod
     def node_to_buffer_id(self, node_id: NodeId) -> ShortId:
         pass
@@ -60,7 +60,7 @@ def get_buffer_lines_from_view(buffer_view: View, db: MinimalDb, transposed: boo
 
         if cur_node_id not in last_sync:
             last_sync[cur_node_id] = NodeData(content_lines, OrderedSet(descendant_ids))
-        last_sync.line_info[len(buffer_lines)] = LineInfo(cur_node_id, parent_view, cur_nest_level)
+        last_sync.set_line_info(len(buffer_lines), LineInfo(cur_node_id, parent_view, cur_nest_level))
 
         buffer_descendant_context = cur_context[cur_node_id]
 
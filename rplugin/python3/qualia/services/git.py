@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Event
 from pathlib import Path
 from sys import path, argv
 from uuid import UUID
@@ -13,17 +15,19 @@ from typing import Optional, TYPE_CHECKING, cast
 from qualia.config import GIT_BRANCH, GIT_AUTHORIZED_REMOTE, _GIT_DATA_FOLDER, \
     _GIT_ENCRYPTION_ENABLED_FILE_NAME, _GIT_FOLDER, ENABLE_GIT_SYNC
 from qualia.models import CustomCalledProcessError, GitChangedNodes, GitMergeError, KeyNotFoundError, NodeId, \
-    InvalidFileChildrenLine
+    InvalidFileChildrenLine, Li
 from qualia.utils.bootstrap_utils import repository_setup, bootstrap
 from qualia.utils.common_utils import cd_run_git_cmd, file_name_to_file_id, live_logger, \
-    exception_traceback, conflict, trigger_buffer_change
+    exception_traceback, conflict, trigger_buffer_change, StartLoggedThread
 from qualia.database import Database
 from qualia.services.utils.git_utils import create_markdown_file, repository_file_to_content_children, \
-    GitInit, node_git_filepath
+    GitInit, remove_node_git_file, repository_file_names
 
 if TYPE_CHECKING:
     from pynvim import Nvim
 
+_FILE_READ_WORKERS = 8
+
 
 def sync_with_git(nvim):
     # type:(Optional[Nvim]) -> None
@@ -47,12 +51,15 @@ def sync_with_git(nvim):
                     if nvim:
                         trigger_buffer_change(nvim)
                 db_to_directory(db, repository_encrypted)
-            push_to_remote()
+            changes_committed = commit_changes()
+        if changes_committed:
+            push_in_background()
     except Exception as e:
         if nvim and isinstance(e, GitMergeError):
-            nvim.async_call(
-                nvim.err_write(
-                    "Merging the new changes in git repository failed. Inspect at " + _GIT_FOLDER.as_posix()))
+            # Report from the event loop since this runs in the git sync thread
+            nvim.async_call(nvim.err_write,
+                            "Merging the new changes in git repository failed. Inspect at " + _GIT_FOLDER.as_posix()
+                            + "\n")
         live_logger.critical(
             "Error while syncing with git\n" + exception_traceback(e))
         raise e
@@ -72,10 +79,12 @@ def fetch_from_remote() -> list[str]:
         try:
             cd_run_git_cmd(["merge-base", "--is-ancestor", "FETCH_HEAD", "HEAD"])
         except CustomCalledProcessError:
+            # Diffing against HEAD before the merge saves resolving and remembering the pre-merge commit
             try:
-                commit_hash_before_merge = cd_run_git_cmd(["rev-parse", "HEAD"])
+                changed_file_names: Optional[list[str]] = cd_run_git_cmd(
+                    ["diff", "--name-only", "HEAD", "FETCH_HEAD"]).splitlines()
             except CustomCalledProcessError:
-                commit_hash_before_merge = None
+                changed_file_names = None  # No commits yet
             try:
                 cd_run_git_cmd(["merge", "FETCH_HEAD", "--allow-unrelated-histories"])
             except GitMergeError as exp:
@@ -86,61 +95,106 @@ def fetch_from_remote() -> list[str]:
                 # else:
                 #     raise exp
             else:
-                changed_file_names = _GIT_DATA_FOLDER.glob("*.md") if commit_hash_before_merge is None else cd_run_git_cmd(
-                    ["diff", "--name-only", commit_hash_before_merge, "FETCH_HEAD"]).splitlines()
-                return changed_file_names
+                return repository_file_names() if changed_file_names is None else changed_file_names
     return []
 
 
-def push_to_remote() -> None:
+def commit_changes() -> bool:
     cd_run_git_cmd(["add", "-A"])
     if cd_run_git_cmd(["status", "--porcelain"]):
         cd_run_git_cmd(["commit", "-m", "⎛⎝(='.'=)⎠⎞"])
+        return True
+    return False
+
+
+def push_to_remote() -> None:
+    try:
+        cd_run_git_cmd(["push", "-u", GIT_AUTHORIZED_REMOTE, GIT_BRANCH])
+    except CustomCalledProcessError as e:
+        live_logger.debug("Could not push: " + str(e))
+
+
+_push_lock = Lock()
+_push_requested = Event()
+
+
+def push_in_background() -> None:
+    """Pushes in a separate thread so that the sync doesn't wait on the network. Requests made while a push is
+    running are coalesced into one more push."""
+    _push_requested.set()
+    if _push_lock.acquire(blocking=False):
+        StartLoggedThread(_push_requested_commits, "GitPush", 0)
+
+
+def _push_requested_commits() -> None:
+    while True:
         try:
-            cd_run_git_cmd(["push", "-u", GIT_AUTHORIZED_REMOTE, GIT_BRANCH])
-        except CustomCalledProcessError as e:
-            live_logger.debug("Could not push: " + str(e))
+            while _push_requested.is_set():
+                _push_requested.clear()
+                # Push writes to the repository (e.g. upstream config) so it is serialized with other git work
+                with GitInit():
+                    push_to_remote()
+        finally:
+            _push_lock.release()
+        # Request made just before the lock release would otherwise wait for the next commit
+        if not (_push_requested.is_set() and _push_lock.acquire(blocking=False)):
+            break
 
 
 def directory_to_db(db: Database, changed_file_names: list[str], repository_encrypted: bool) -> None:
     changed_nodes: GitChangedNodes = {}
-    for file_name in changed_file_names:
-        relative_file_path = Path(file_name)
-        absolute_file_path = _GIT_DATA_FOLDER.joinpath(file_name)
-        if absolute_file_path.exists() and len(relative_file_path.parts) == 1 and absolute_file_path.is_file():
-            try:
-                file_id = file_name_to_file_id(relative_file_path.name, ".md")
-                UUID(file_id)
-                node_id = cast(NodeId, file_id)
-            except ValueError:
-                live_logger.critical(f"Invalid {relative_file_path}")
-            else:
-                try:
-                    content_lines, children_ids = repository_file_to_content_children(absolute_file_path, repository_encrypted)
-                except InvalidFileChildrenLine as e:
-                    live_logger.critical(
-                        f"{file_name} is in invalid format. Could not extract it's content and children.")
-                    raise e
-                changed_nodes[node_id] = OrderedSet(children_ids), content_lines
+    # File reads (and decryption) overlap across threads while the db writes stay on this thread
+    with ThreadPoolExecutor(max_workers=_FILE_READ_WORKERS, thread_name_prefix="GitFileReader") as executor:
+        for node_data in executor.map(lambda file_name: _load_repository_file(file_name, repository_encrypted),
+                                      changed_file_names):
+            if node_data is not None:
+                node_id, children_ids, content_lines = node_data
+                changed_nodes[node_id] = children_ids, content_lines
 
     sync_git_to_db(changed_nodes, db)
 
 
+def _load_repository_file(file_name: str, repository_encrypted: bool) -> Optional[
+        tuple[NodeId, OrderedSet[NodeId], Li]]:
+    relative_file_path = Path(file_name)
+    absolute_file_path = _GIT_DATA_FOLDER.joinpath(file_name)
+    if absolute_file_path.exists() and len(relative_file_path.parts) == 1 and absolute_file_path.is_file():
+        try:
+            file_id = file_name_to_file_id(relative_file_path.name, ".md")
+            UUID(file_id)
+            node_id = cast(NodeId, file_id)
+        except ValueError:
+            live_logger.critical(f"Invalid {relative_file_path}")
+        else:
+            try:
+                content_lines, children_ids = repository_file_to_content_children(absolute_file_path,
+                                                                                   repository_encrypted)
+            except InvalidFileChildrenLine as e:
+                live_logger.critical(
+                    f"{file_name} is in invalid format. Could not extract it's content and children.")
+                raise e
+            return node_id, children_ids, content_lines
+    return None
+
+
 def sync_git_to_db(changed_nodes: GitChangedNodes, db: Database) -> None:
+    if_unsynced_children, if_unsynced_content = db.if_unsynced_children, db.if_unsynced_content
+    get_node_descendants, set_node_descendants = db.get_node_descendants, db.set_node_descendants
+    get_node_content_lines, set_node_content_lines = db.get_node_content_lines, db.set_node_content_lines
     for cur_node_id, (children_ids, content_lines) in changed_nodes.items():
-        if db.if_unsynced_children(cur_node_id):
-            db_children_ids = db.get_node_descendants(cur_node_id, False, True)
+        if if_unsynced_children(cur_node_id):
+            db_children_ids = get_node_descendants(cur_node_id, False, True)
             children_ids.update(db_children_ids)
-        db.set_node_descendants(cur_node_id, children_ids, False)
+        set_node_descendants(cur_node_id, children_ids, False)
 
-        if db.if_unsynced_content(cur_node_id):
+        if if_unsynced_content(cur_node_id):
             try:
-                db_content_lines = db.get_node_content_lines(cur_node_id)
+                db_content_lines = get_node_content_lines(cur_node_id)
             except KeyNotFoundError:
                 pass
             else:
                 content_lines = conflict(content_lines, db_content_lines)
-        db.set_node_content_lines(cur_node_id, content_lines)
+        set_node_content_lines(cur_node_id, content_lines)
 
 
 def db_to_directory(db: Database, repository_encrypted: bool) -> None:
@@ -149,11 +203,16 @@ def db_to_directory(db: Database, repository_encrypted: bool) -> None:
         if db.is_valid_node(node_id):
             modified_node_ids.add(node_id)
         else:
-            node_git_filepath(node_id).unlink(missing_ok=True)
+            remove_node_git_file(node_id)
             parents = db.get_node_descendants(node_id, True, True)
             modified_node_ids.update(parents)
-    for node_id in modified_node_ids:
-        create_markdown_file(db, node_id, repository_encrypted)
+
+    # Read everything first so that the file writes run back to back
+    node_ids = list(modified_node_ids)
+    nodes_content_lines = db.get_nodes_content_lines(node_ids)
+    nodes_children_ids = db.get_nodes_descendants(node_ids, False, True)
+    for node_id, content_lines, children_ids in zip(node_ids, nodes_content_lines, nodes_children_ids):
+        create_markdown_file(node_id, content_lines, children_ids, repository_encrypted)
 
 
 if __name__ == "__main__" and argv[-1].endswith("git.py"):
@@ -1,21 +1,28 @@
 from functools import cache
-from os import symlink
+from locale import getpreferredencoding
+from os import symlink, unlink, scandir
+from os.path import join
 from pathlib import Path
-from re import search
+from re import compile
 from signal import getsignal, SIGTERM, SIG_DFL, signal, Signals
-from tempfile import gettempdir
+from tempfile import TemporaryDirectory
 from time import sleep
 from types import FrameType
-from typing import Iterable, cast
+from typing import Iterable, cast, Callable
 
 from orderedset import OrderedSet
 
 from qualia.config import GIT_SEARCH_URL, _GIT_DATA_FOLDER, GIT_BRANCH, _SORT_SIBLINGS, _GIT_FOLDER
-from qualia.database import Database
 from qualia.models import NodeId, El, Li, InvalidFileChildrenLine
-from qualia.utils.common_utils import cd_run_git_cmd, live_logger, open_write_lf, decrypt_lines, encrypt_lines
+from qualia.utils.common_utils import cd_run_git_cmd, live_logger, open_write_lf, decrypt_lines, \
+    encrypt_lines_token
 
 _CONTENT_CHILDREN_SEPARATOR_LINES = ["<hr>", ""]
+_MARKDOWN_WRITE_BUFFER_BYTES = 1 << 16
+_GIT_DATA_DIRECTORY = _GIT_DATA_FOLDER.as_posix()
+_CHILD_LINE_NODE_ID_REGEX = compile(r"[0-9a-f]{8}(?:-?[0-9a-f]{4}){4}[0-9a-f]{8}(?=\.md\)$)")
+_CHILD_LINE_NODE_ID_MAX_SUFFIX_LENGTH = len("01234567-0123-0123-0123-0123456789ab.md)")
+_sibling_order: Callable[[Iterable[NodeId]], Iterable[NodeId]] = sorted if _SORT_SIBLINGS else iter
 
 
 def add_children_to_node_directory(node_children_ids: Iterable[NodeId], node_directory_path: Path):
@@ -31,24 +38,19 @@ def add_children_to_node_directory(node_children_ids: Iterable[NodeId], node_dir
 
 @cache
 def symlinks_enabled() -> bool:
-    temp_dir = Path(gettempdir())
-    for try_num in range(100):
-        src = temp_dir.joinpath(f'{try_num}.test.q')
+    # Fresh directory so that the probe file names can't already exist
+    with TemporaryDirectory() as temp_dir:
+        src = join(temp_dir, 'test.q')
+        open(src, 'x').close()
         try:
-            open(src, 'x').close()
-            symlink_dest = temp_dir.joinpath('.symlink.test.q')
-            symlink(src, symlink_dest)
-            symlink_dest.unlink()
-        except FileExistsError:
-            continue
+            symlink(src, join(temp_dir, '.symlink.test.q'))
         except (NotImplementedError, OSError):
             return False
-        src.unlink()
-        break
     return True
 
 
-def create_markdown_file(db: Database, node_id: NodeId, repository_encrypted: bool) -> None:
+def create_markdown_file(node_id: NodeId, content_lines: Li, valid_node_children_ids: OrderedSet[NodeId],
+                         repository_encrypted: bool) -> None:
     """
     CONTENT
     CONTENT ...
@@ -57,23 +59,39 @@ def create_markdown_file(db: Database, node_id: NodeId, repository_encrypted: bo
     Line containing child's "<UUID>.md"
     Line containing child's "<UUID>.md" ...
     """
-    content_lines = db.get_node_content_lines(node_id)
-    markdown_file_lines = encrypt_lines(content_lines) if repository_encrypted else content_lines
-    valid_node_children_ids = db.get_node_descendants(node_id, False, True)
-    markdown_file_lines.append(f"<hr><ol start=0><li><a href='{GIT_SEARCH_URL + node_id}+md'>Backlinks</a></li></ol>)")
-    markdown_file_lines.append("")
-    for i, child_id in enumerate(sorted(valid_node_children_ids) if _SORT_SIBLINGS else valid_node_children_ids):
-        markdown_file_lines.append(f"{i+1}. [`{child_id}`]({child_id}.md)")
-    open_write_lf(node_git_filepath(node_id), False, markdown_file_lines)
+    # Same encoding as text mode open() so that existing repository files stay readable
+    encoding = getpreferredencoding(False)
+    with open(node_git_filepath(node_id), 'wb', buffering=_MARKDOWN_WRITE_BUFFER_BYTES) as file:
+        if repository_encrypted:
+            # Encrypted token bytes are written as is instead of decoding them to text first
+            file.write(encrypt_lines_token(content_lines) + b"\n")
+        elif content_lines:
+            file.write(('\n'.join(content_lines) + '\n').encode(encoding))
+        file.write(f"<hr><ol start=0><li><a href='{GIT_SEARCH_URL + node_id}+md'>Backlinks</a></li></ol>)\n\n"
+                   .encode(encoding))
+        file.writelines(f"{i}. [`{child_id}`]({child_id}.md)\n".encode(encoding)
+                        for i, child_id in enumerate(_sibling_order(valid_node_children_ids), 1))
 
 
-def node_git_filepath(node_id: NodeId) -> Path:
-    return _GIT_DATA_FOLDER.joinpath(node_id + ".md")
+def node_git_filepath(node_id: NodeId) -> str:
+    return join(_GIT_DATA_DIRECTORY, node_id + ".md")
+
+
+def remove_node_git_file(node_id: NodeId) -> None:
+    try:
+        unlink(node_git_filepath(node_id))
+    except FileNotFoundError:
+        pass
+
+
+def repository_file_names() -> list[str]:
+    with scandir(_GIT_DATA_DIRECTORY) as entries:
+        return [entry.name for entry in entries if entry.name.endswith(".md") and entry.is_file(follow_symlinks=False)]
 
 
 def file_children_line_to_node_id(line: str) -> NodeId:
     # TODO: Case sensitivity?
-    uuid_match = search(r"[0-9a-f]{8}(?:-?[0-9a-f]{4}){4}[0-9a-f]{8}(?=\.md\)$)", line)
+    uuid_match = _CHILD_LINE_NODE_ID_REGEX.search(line, len(line) - _CHILD_LINE_NODE_ID_MAX_SUFFIX_LENGTH)
     if not uuid_match:
         raise InvalidFileChildrenLine(f"Child node ID for '{line}' couldn't be parsed")
     return cast(NodeId, uuid_match.group())
@@ -82,18 +100,16 @@ def file_children_line_to_node_id(line: str) -> NodeId:
 def repository_file_to_content_children(file_path: Path, encrypted: bool) -> tuple[Li, OrderedSet]:
     with open(file_path) as file:
         lines = file.read().splitlines()
-        children_ids = []
-
-        while lines:
-            line = lines.pop()
-            if line:
-                children_ids.append(file_children_line_to_node_id(line))
-            else:
-                lines.pop()
-                break
 
-        lines = decrypt_lines(cast(El, lines)) if encrypted else cast(Li, lines)
-        return lines, OrderedSet(reversed(children_ids))
+    # Children lines follow the last empty line which itself follows the backlink line
+    separator_idx = len(lines) - 1
+    while separator_idx >= 0 and lines[separator_idx]:
+        separator_idx -= 1
+    children_ids = OrderedSet([file_children_line_to_node_id(line) for line in lines[separator_idx + 1:]])
+    del lines[max(separator_idx - 1, 0):]
+
+    lines = decrypt_lines(cast(El, lines)) if encrypted else cast(Li, lines)
+    return lines, children_ids
 
 
 def sigterm_handler(_signal: Signals, _traceback_frame: FrameType) -> None:
@@ -105,7 +121,7 @@ class GitInit:
         signal(SIGTERM, sigterm_handler)  # Signal handler (for pid) must be set from main thread
 
     def __enter__(self) -> None:
-        from pid import PidFile, PidFileAlreadyLockedError  # 0.06s
+        from pid import PidFile, PidFileAlreadyLockedError  # 0.06s on first import (preloaded by accelerated_import)
         self.process_lock = PidFile(pidname="qualia_lock", piddir=_GIT_FOLDER.joinpath(".git"),
                                     register_term_signal_handler=False)  # Can't register handler in non-main thread
         retry_count = 10
@@ -1,9 +1,8 @@
 from __future__ import annotations
 
-from itertools import zip_longest
 from threading import Event
 from time import time
-from typing import cast, Union, TYPE_CHECKING, Iterator
+from typing import cast, TYPE_CHECKING, Iterator, Optional
 
 from orderedset import OrderedSet
 
@@ -13,7 +12,7 @@ from qualia.services.realtime import Realtime
 from qualia.services.utils.realtime_utils import sync_with_realtime_db
 from qualia.utils.buffer_utils import get_md_ast, get_id_line, get_ast_sub_lists, raise_if_duplicate_sibling, \
     preserve_expand_consider_sub_tree
-from qualia.utils.common_utils import conflict, removeprefix
+from qualia.utils.common_utils import conflict
 from qualia.utils.render_utils import buffer_node_tracker
 from qualia.utils.sync_utils import sync_with_db
 
@@ -37,6 +36,9 @@ def sync_buffer(buffer_lines: Li, main_id: NodeId, last_sync: LastSync, db: Data
 class ParseProcess:
     _lines: Li
     _changes: ProcessState
+    _pending_nodes: list[tuple[NodeId, Li, Optional[Tree]]]
+    _main_id: NodeId
+    _main_id_line: str
     db: MinimalDb
 
     def __init__(self) -> None:
@@ -48,110 +50,142 @@ class ParseProcess:
             lines = cast(Li, [''])
         self.db = db
         self._changes = ProcessState()
+        self._pending_nodes = []
         self._lines = lines
 
+        # Tracker prefix is still needed for markdown parsing of the first line but the main node's id is known
+        self._main_id, self._main_id_line = main_id, self._lines[0]
         self._lines[0] = buffer_node_tracker(main_id, transposed, db) + self._lines[0]
 
         buffer_tree: Tree = {}  # {node_id: {descendant_1: {..}, descendant_2: {..}, ..}}
 
         buffer_ast = get_md_ast(self._lines)
-        self._process_list_item_ast(buffer_ast, buffer_tree, iter([]), last_sync)
+        self._process_list_item_ast(buffer_ast, buffer_tree, last_sync)
+        self._process_nodes(last_sync)
 
         data = buffer_tree.popitem()
         root_view = View(*data, transposed)
         return root_view, self._changes
 
-    def _process_list_item_ast(self, list_item_ast, tree, ordered_descendant_asts, last_sync):
-        # type:(SyntaxTreeNode, Tree, Iterator[SyntaxTreeNode], LastSync)->None
-        is_buffer_ast = list_item_ast.type == 'root'
-        assert list_item_ast.map
-        content_start_line_num = list_item_ast.map[0]
-        content_indent = 0 if is_buffer_ast else self._lines[content_start_line_num].index(
-            list_item_ast.markup) + 2
-        first_line = self._lines[content_start_line_num][content_indent:]
-        node_id, id_line = get_id_line(first_line, self.db)
-        list_item_ast.meta[NODE_ID_ATTR] = node_id
-
-        sub_lists = get_ast_sub_lists(list_item_ast)
-        sub_list_tree = self._process_list_item_asts(sub_lists, last_sync)
-        try:
-            first_ordered_descendant_ast = next(ordered_descendant_asts)
-            self._process_list_item_ast(first_ordered_descendant_ast, sub_list_tree, ordered_descendant_asts, last_sync)
-        except StopIteration:
-            pass
-
-        content_end_line_num = cast(AstMap, sub_lists[0].map)[0] if sub_lists else list_item_ast.map[1]
-
-        raise_if_duplicate_sibling(list_item_ast, node_id, tree)
-
-        expand, consider_sub_list_tree = (True, True) if is_buffer_ast else preserve_expand_consider_sub_tree(
-            list_item_ast, node_id, sub_list_tree, last_sync)
-        tree[node_id] = sub_list_tree if expand else None
-
-        content_lines = cast(Li, [id_line] + [
-            removeprefix(line, " " * content_indent)
-            for line in self._lines[content_start_line_num + 1: content_end_line_num]
-        ])
-
-        self._process_node(node_id, content_lines, OrderedSet(sub_list_tree) if consider_sub_list_tree else None,
-                           last_sync)
-
-    def _process_list_item_asts(self, list_item_asts, last_sync):
-        # type:(list[SyntaxTreeNode], LastSync) -> Tree
-        sub_list_tree: Tree = {}
-        if not list_item_asts:
-            return sub_list_tree
-        parent_list_ast = list_item_asts[0].parent
+    def _process_list_item_ast(self, buffer_ast, buffer_tree, last_sync):
+        # type:(SyntaxTreeNode, Tree, LastSync)->None
+        # Depth first walk with an explicit stack. An entry carrying the node state is the post-order visit.
+        # Deep nesting can still raise RecursionError since building the SyntaxTreeNode in get_md_ast recurses.
+        stack: list[tuple[SyntaxTreeNode, Tree, Iterator[SyntaxTreeNode], Optional[tuple[NodeId, str, int, list[
+            SyntaxTreeNode], Tree]]]] = [(buffer_ast, buffer_tree, iter([]), None)]
+        while stack:
+            list_item_ast, tree, ordered_descendant_asts, node_state = stack.pop()
+            is_buffer_ast = list_item_ast.type == 'root'
+            assert list_item_ast.map
+            content_start_line_num = list_item_ast.map[0]
+
+            if node_state is None:
+                if is_buffer_ast:
+                    content_indent = 0
+                    node_id, id_line = self._main_id, self._main_id_line
+                else:
+                    content_indent = self._lines[content_start_line_num].index(list_item_ast.markup) + 2
+                    first_line = self._lines[content_start_line_num][content_indent:]
+                    node_id, id_line = get_id_line(first_line, self.db)
+                list_item_ast.meta[NODE_ID_ATTR] = node_id
+
+                sub_lists = get_ast_sub_lists(list_item_ast)
+                sub_list_tree: Tree = {}
+                stack.append((list_item_ast, tree, ordered_descendant_asts,
+                              (node_id, id_line, content_indent, sub_lists, sub_list_tree)))
+                # Popped in reverse: sub list items first, then the next ordered item (nested under this one)
+                first_ordered_descendant_ast = next(ordered_descendant_asts, None)
+                if first_ordered_descendant_ast is not None:
+                    stack.append((first_ordered_descendant_ast, sub_list_tree, ordered_descendant_asts, None))
+                stack.extend((descendant_ast, sub_list_tree, later_ordered_asts, None) for
+                             descendant_ast, later_ordered_asts in reversed(self._sub_list_item_asts(sub_lists)))
+                continue
+
+            node_id, id_line, content_indent, sub_lists, sub_list_tree = node_state
+            content_end_line_num = cast(AstMap, sub_lists[0].map)[0] if sub_lists else list_item_ast.map[1]
+
+            raise_if_duplicate_sibling(list_item_ast, node_id, tree)
+
+            expand, consider_sub_list_tree = (True, True) if is_buffer_ast else preserve_expand_consider_sub_tree(
+                list_item_ast, node_id, sub_list_tree, last_sync)
+            tree[node_id] = sub_list_tree if expand else None
+
+            content_lines = cast(Li, [id_line])
+            indent_prefix = " " * content_indent
+            content_lines.extend(line[content_indent:] if line.startswith(indent_prefix) else line
+                                 for line in self._lines[content_start_line_num + 1: content_end_line_num])
+
+            self._pending_nodes.append((node_id, content_lines, sub_list_tree if consider_sub_list_tree else None))
+
+    @staticmethod
+    def _sub_list_item_asts(list_asts):
+        # type:(list[SyntaxTreeNode]) -> list[tuple[SyntaxTreeNode, Iterator[SyntaxTreeNode]]]
+        """Sets the line range of every list item and returns the items to walk in order along with the ordered
+        list items to be nested under each"""
+        sub_list_item_asts: list[tuple[SyntaxTreeNode, Iterator[SyntaxTreeNode]]] = []
+        if not list_asts:
+            return sub_list_item_asts
+        parent_list_ast = list_asts[0].parent
         assert parent_list_ast
         ast_parent_end_line = cast(AstMap, parent_list_ast.map)[1]
-        for list_item_ast, list_end_line in zip_longest(list_item_asts,
-                                                        (cast(AstMap, ast.map)[0] for ast in list_item_asts[1:]),
-                                                        fillvalue=ast_parent_end_line):
-            descendant_asts = list_item_ast.children
+        list_end_lines = [cast(AstMap, ast.map)[0] for ast in list_asts[1:]]
+        list_end_lines.append(ast_parent_end_line)
+        for list_ast, list_end_line in zip(list_asts, list_end_lines):
+            descendant_asts = list_ast.children
             if not descendant_asts:
                 continue
             later_descendant_asts = descendant_asts[1:]
 
-            ordered_list = list_item_ast.type == 'ordered_list'
+            ordered_list = list_ast.type == 'ordered_list'
 
-            for descendant_list_item_ast, item_end_line in zip_longest(descendant_asts,
-                                                                       (ast.map[0] for ast in later_descendant_asts),
-                                                                       fillvalue=list_end_line):
+            # Each item ends where the next one starts and the last one where the list ends
+            item_end_lines = [cast(AstMap, ast.map)[0] for ast in later_descendant_asts]
+            item_end_lines.append(list_end_line)
+            for descendant_list_item_ast, item_end_line in zip(descendant_asts, item_end_lines):
                 token_obj = descendant_list_item_ast.token or descendant_list_item_ast.nester_tokens.opening
                 token_obj.map = descendant_list_item_ast.map[0], item_end_line
 
                 if not ordered_list:
-                    self._process_list_item_ast(descendant_list_item_ast, sub_list_tree, iter([]), last_sync)
+                    sub_list_item_asts.append((descendant_list_item_ast, iter([])))
 
             if ordered_list:
-                self._process_list_item_ast(descendant_asts[0], sub_list_tree, iter(later_descendant_asts), last_sync)
-        return sub_list_tree
-
-    def _process_node(self, node_id: NodeId, content_lines: Li, descendant_ids: Union[None, OrderedSet],
-                      last_sync: LastSync):
-        if node_id not in last_sync:
-            self._changes.changed_content_map[node_id] = content_lines
-            if descendant_ids is not None:
-                self._changes.changed_descendants_map[node_id] = descendant_ids
-            return
-
-        # Assuming real-time update else suppose user changes a node then scrolls to portion of
-        # buffer containing the node's clone but with stale content. Now user writes the buffer
-        # manually expecting the visible node to stay the same but it changes. Though the incoming
-        # change is similar to the change coming from external syncing source.
-
-        content_changed = last_sync[node_id].content_lines != content_lines
-        if content_changed:
-            if node_id in self._changes.changed_content_map:
-                self._changes.changed_content_map[node_id] = conflict(content_lines,
-                                                                      self._changes.changed_content_map[node_id])
-            else:
-                self._changes.changed_content_map[node_id] = content_lines
-
-        descendant_changed = descendant_ids is not None and (
-            descendant_ids.symmetric_difference(last_sync[node_id].descendants_ids))
-        if descendant_changed:
-            if node_id in self._changes.changed_descendants_map:
-                self._changes.changed_descendants_map[node_id].update(descendant_ids)
-            else:
-                self._changes.changed_descendants_map[node_id] = descendant_ids
+                sub_list_item_asts.append((descendant_asts[0], iter(later_descendant_asts)))
+        return sub_list_item_asts
+
+    def _process_nodes(self, last_sync: LastSync) -> None:
+        # Nodes are collected during the ast walk and compared against last sync in a single pass
+        last_sync_data = last_sync.data
+        changed_content_map = self._changes.changed_content_map
+        changed_descendants_map = self._changes.changed_descendants_map
+        for node_id, content_lines, descendant_tree in self._pending_nodes:
+            node_last_sync = last_sync_data.get(node_id)
+            if node_last_sync is None:
+                changed_content_map[node_id] = content_lines
+                if descendant_tree is not None:
+                    changed_descendants_map[node_id] = OrderedSet(descendant_tree)
+                continue
+
+            # Assuming real-time update else suppose user changes a node then scrolls to portion of
+            # buffer containing the node's clone but with stale content. Now user writes the buffer
+            # manually expecting the visible node to stay the same but it changes. Though the incoming
+            # change is similar to the change coming from external syncing source.
+
+            content_changed = node_last_sync.content_lines != content_lines
+            if content_changed:
+                if node_id in changed_content_map:
+                    changed_content_map[node_id] = conflict(content_lines, changed_content_map[node_id])
+                else:
+                    changed_content_map[node_id] = content_lines
+
+            if descendant_tree is not None:
+                last_descendant_ids = node_last_sync.descendants_ids
+                # Same length and subset means same members (order is not considered). Probing the tree dict keeps
+                # the check in C instead of OrderedSet comparisons.
+                descendant_changed = len(descendant_tree) != len(last_descendant_ids) or not all(
+                    map(descendant_tree.__contains__, last_descendant_ids))
+                if descendant_changed:
+                    descendant_ids = OrderedSet(descendant_tree)
+                    if node_id in changed_descendants_map:
+                        changed_descendants_map[node_id].update(descendant_ids)
+                    else:
+                        changed_descendants_map[node_id] = descendant_ids
@@ -23,10 +23,34 @@ def _md_parser() -> Callable[[str], Sequence[Token]]:
         ["link", "list", "code", "fence", "html_block"]).parse
 
 
+# Token fields rewritten in place while processing the ast (map, meta, list type)
+_MUTABLE_TOKEN_TYPES = frozenset(
+    ("bullet_list_open", "bullet_list_close", "ordered_list_open", "ordered_list_close", "list_item_open"))
+_last_md_parse: tuple[Optional[str], Sequence[Token],
+                      list[tuple[Token, Optional[list[int]], str, str, Optional[dict[str, object]]]]] = (None, (), [])
+
+
+def _md_tokens(source: str) -> Sequence[Token]:
+    # Autocommands force a sync on cursor hold, focus and buffer enter so unchanged text is the common case
+    global _last_md_parse
+    last_source, tokens, parsed_fields = _last_md_parse
+    if source == last_source:
+        # Undo the previous processing instead of copying tokens on every parse
+        for token, token_map, tag, token_type, meta in parsed_fields:
+            token.map, token.tag, token.type = token_map, tag, token_type
+            token.meta = {} if meta is None else meta.copy()
+    else:
+        tokens = _md_parser()(source)
+        _last_md_parse = source, tokens, [
+            (token, token.map, token.tag, token.type, token.meta.copy() if token.meta else None) for token in tokens
+            if token.type in _MUTABLE_TOKEN_TYPES]
+    return tokens
+
+
 def get_md_ast(content_lines: Li) -> SyntaxTreeNode:
     from markdown_it.tree import SyntaxTreeNode
     from markdown_it.token import Token
-    root_ast = SyntaxTreeNode(_md_parser()('\n'.join(content_lines)))
+    root_ast = SyntaxTreeNode(_md_tokens('\n'.join(content_lines)))
     root_ast.token = Token(meta={}, map=[0, len(content_lines)], nesting=0, tag="", type="root")
     return root_ast
 
@@ -40,9 +64,11 @@ def buffer_to_node_id(buffer_node_id: ShortId, db: MinimalDb) -> NodeId:
     return node_id
 
 
+_ID_REGEX = compile(r"\[]\(.(.+?)\) {0,2}")
+
+
 def get_id_line(line: str, db: MinimalDb) -> tuple[NodeId, str]:
-    id_regex = compile(r"\[]\(.(.+?)\) {0,2}")
-    id_match = id_regex.match(line)
+    id_match = _ID_REGEX.match(line)
     if id_match:
         line = removeprefix(line, id_match.group(0))
         buffer_node_id = ShortId(id_match.group(1))
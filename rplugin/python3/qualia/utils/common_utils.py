@@ -5,7 +5,7 @@ from base64 import urlsafe_b64encode, b64decode, b64encode, b32decode, b32encode
 from bisect import bisect_left, insort
 from hashlib import sha256
 from json import dumps
-from logging import getLogger
+from logging import getLogger, _nameToLevel
 from math import ceil
 from os import PathLike
 from re import split
@@ -72,9 +72,12 @@ def file_name_to_file_id(full_name: str, extension: str) -> str:
 # @line_profiler_pycharm.profile
 
 
+_GIT_COMMAND_PREFIX = ["git", "-C", _GIT_FOLDER.as_posix()]
+
+
 def cd_run_git_cmd(arguments: list[str]) -> str:
     try:
-        result = run(["git"] + arguments, check=True, cwd=_GIT_FOLDER, capture_output=True, text=True)
+        result = run(_GIT_COMMAND_PREFIX + arguments, check=True, capture_output=True, text=True)
     except CalledProcessError as e:
         raise CustomCalledProcessError(e)
     stdout = f"{result.stdout}{result.stderr}".strip()
@@ -89,15 +92,26 @@ class _LiveLogger:
         self._visible_levels = {"info", "warning", "error", "critical"}
 
     def __getattr__(self, name) -> Callable[[object], None]:
+        log = getattr(self._logger, name)
+        # Methods like exception() have no level of their own so always format for them
+        level = _nameToLevel.get(name.upper())
+        visible = DEBUG or name in self._visible_levels
+
         def wrapper(msg: object) -> None:
+            show = visible and self._nvim is not None
+            # Skip stringifying when the message goes nowhere
+            if not (show or level is None or self._logger.isEnabledFor(level)):
+                return
             msg = str(msg)
-            if self._nvim is not None and (DEBUG or name in self._visible_levels):
+            if show:
                 try:
                     self._nvim.async_call(self._nvim.out_write, msg + '\n')
                 except Exception as e:
                     msg += ('\n' + exception_traceback(e))
-            getattr(self._logger, name)(msg)
+            log(msg)
 
+        # Later lookups hit the instance dict instead of rebuilding the wrapper
+        setattr(self, name, wrapper)
         return wrapper
 
     def attach_nvim(self, nvim: Nvim):
@@ -168,7 +182,11 @@ def decrypt_lines(encrypted_lines: El) -> Li:
 
 
 def encrypt_lines(unencrypted_lines: Li) -> El:
-    return cast(El, [fernet.encrypt('\n'.join(unencrypted_lines).encode()).decode()])
+    return cast(El, [encrypt_lines_token(unencrypted_lines).decode()])
+
+
+def encrypt_lines_token(unencrypted_lines: Li) -> bytes:
+    return fernet.encrypt('\n'.join(unencrypted_lines).encode())
 
 
 def trigger_buffer_change(nvim):
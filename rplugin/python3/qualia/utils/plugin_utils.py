@@ -1,9 +1,11 @@
-from collections import defaultdict
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import chain
 from os.path import basename
 from pathlib import Path
 from sys import executable
 from time import sleep
-from typing import Optional, TYPE_CHECKING, cast
+from typing import Optional, cast, Iterable
 from uuid import UUID
 
 from pynvim import Nvim, NvimError
@@ -12,13 +14,13 @@ from qualia.config import NVIM_DEBUG_PIPE, _FZF_LINE_DELIMITER, _TRANSPOSED_FILE
 from qualia.config import _FILE_FOLDER
 from qualia.database import Database
 from qualia.models import NodeId, DuplicateNodeException, UncertainNodeChildrenException, View, BufferId, LastSync, \
-    LineInfo, KeyNotFoundError, FileId, MinimalDb
+    LineInfo, KeyNotFoundError, FileId, MinimalDb, EditorSnapshot, BufferState
 from qualia.utils.buffer_utils import buffer_to_node_id
 from qualia.utils.common_utils import live_logger, exception_traceback, file_name_to_file_id, buffer_id_decoder, \
     buffer_id_encoder, compact_base32_encode, compact_base32_decode
 
-if TYPE_CHECKING:
-    from pynvim.api import Buffer
+_FILEPATH_CACHE_SIZE = 256
+_FZF_PREVIEW_COMMAND = executable + " " + Path(__file__).parent.parent.joinpath('services/preview.py').as_posix() + " {1} 1"
 
 
 class PluginUtils:
@@ -26,12 +28,11 @@ class PluginUtils:
     def __init__(self, nvim: Nvim, debugging: bool):
         self.nvim = nvim
         self.ide_debugging = nvim.eval('v:servername') == NVIM_DEBUG_PIPE or debugging
-        self.highlight_ns = nvim.funcs.nvim_create_namespace("qualia")
+        self.highlight_ns = nvim.api.create_namespace("qualia")
 
-        self.changedtick: dict[BufferId, int] = defaultdict(lambda: -1)
-        self.undo_seq: dict[BufferId, int] = {}
-        self.buffer_last_sync: dict[BufferId, LastSync] = defaultdict(lambda: LastSync(None))
-        self.last_git_sync = 0.
+        self.buffer_states: dict[BufferId, BufferState] = {}
+        # Resolved (main id, transposed) of recently processed file paths, least recent first
+        self._filepath_nodes: OrderedDict[str, tuple[NodeId, bool]] = OrderedDict()
         self.enabled: bool = True
 
     def replace_with_file(self, filepath: str, replace_buffer: bool) -> None:
@@ -50,14 +51,40 @@ class PluginUtils:
                 raise e
 
     def current_buffer_file_path(self) -> str:
-        vim_path = self.nvim.eval("resolve(expand('%:p'))")
+        # Buffer name is already absolute and symlinks are resolved on our side
+        return self._resolved_file_path(self.nvim.api.buf_get_name(0))
+
+    @staticmethod
+    def _resolved_file_path(vim_path: str) -> str:
         assert vim_path, "Current buffer file path is empty (new buffer?)"
         return Path(vim_path).resolve().as_posix()
 
+    def editor_snapshot(self) -> EditorSnapshot:
+        # Single request instead of a round trip per value
+        results, error = self.nvim.api.call_atomic([
+            ['nvim_call_function', ['mode', []]],
+            ['nvim_call_function', ['undotree', []]],
+            ['nvim_buf_get_changedtick', [0]],
+            ['nvim_call_function', ['bufnr', ['%']]],
+            ['nvim_buf_get_name', [0]],
+        ])
+        if error is not None:
+            raise NvimError(str(error))
+        mode, undotree, changedtick, buffer_number, buffer_name = results
+        return EditorSnapshot(mode=mode, undotree=undotree, changedtick=changedtick, buffer_number=buffer_number,
+                              buffer_name=buffer_name)
+
+    def buffer_state(self, buffer_id: BufferId) -> BufferState:
+        buffer_state = self.buffer_states.get(buffer_id)
+        if buffer_state is None:
+            buffer_state = self.buffer_states[buffer_id] = BufferState()
+        return buffer_state
+
     def navigate_node(self, node_id: NodeId, replace_buffer: bool, db: MinimalDb) -> None:
-        transposed = self.file_path_transposed(self.nvim.current.buffer.name)
+        buffer_name = self.nvim.current.buffer.name
+        transposed = self.file_path_transposed(buffer_name)
         filepath = self.node_id_filepath(node_id, transposed, db)
-        if Path(self.current_buffer_file_path()) != Path(filepath):
+        if Path(self._resolved_file_path(buffer_name)) != Path(filepath):
             self.replace_with_file(filepath, replace_buffer)
 
     def process_view(self, view: View, db: MinimalDb) -> tuple[bool, bool, NodeId]:
@@ -76,7 +103,7 @@ class PluginUtils:
     def process_filepath(self, file_path: str, db: MinimalDb) -> tuple[bool, bool, NodeId]:
         switched_buffer = True
         try:
-            main_id, transposed = self.filepath_node_id_transposed(file_path, db)
+            main_id, transposed = self.cached_filepath_node_id_transposed(file_path, db)
         except ValueError:
             main_id, transposed = self.navigate_root_node(file_path, db)
         else:
@@ -87,6 +114,21 @@ class PluginUtils:
 
         return switched_buffer, transposed, main_id
 
+    def cached_filepath_node_id_transposed(self, file_path: str, db: MinimalDb) -> tuple[NodeId, bool]:
+        filepath_nodes = self._filepath_nodes
+        if file_path in filepath_nodes:
+            node_id_transposed = filepath_nodes[file_path]
+            # Node may have been deleted since, also by another instance sharing the db
+            if not db.is_valid_node(node_id_transposed[0]):
+                del filepath_nodes[file_path]
+                raise ValueError(file_path)
+            filepath_nodes.move_to_end(file_path)
+            return node_id_transposed
+        node_id_transposed = filepath_nodes[file_path] = self.filepath_node_id_transposed(file_path, db)
+        if len(filepath_nodes) > _FILEPATH_CACHE_SIZE:
+            filepath_nodes.popitem(last=False)
+        return node_id_transposed
+
     def navigate_root_node(self, cur_file_path: str, db: MinimalDb) -> tuple[NodeId, bool]:
         transposed = self.file_path_transposed(cur_file_path)
         root_id = db.get_root_id()
@@ -94,7 +136,9 @@ class PluginUtils:
         live_logger.info("Redirecting to root node")
         return root_id, transposed
 
-    def current_buffer_id(self) -> Optional[BufferId]:
+    def current_buffer_id(self, snapshot: Optional[EditorSnapshot] = None) -> Optional[BufferId]:
+        if snapshot is not None:
+            return snapshot['buffer_number'], self._resolved_file_path(snapshot['buffer_name'])
         buffer_number: int = self.nvim.current.buffer.number
         try:
             file_path = self.current_buffer_file_path()
@@ -106,25 +150,25 @@ class PluginUtils:
     def current_line_number(self) -> int:
         return self.nvim.funcs.line('.') - 1
 
-    def handle_duplicate_node(self, buffer, exp):
-        # type: (Buffer, DuplicateNodeException)->None
-        self.nvim.command("set nowrite")
+    def handle_duplicate_node(self, buffer_number: int, exp: DuplicateNodeException) -> None:
         live_logger.info(
             f"Parsing paused: duplicate siblings at lines {', '.join([str(first_line) for first_line, _ in exp.line_ranges])}")
         self.enabled = False
-        for node_locs in exp.line_ranges:
-            for line_num in range(node_locs[0], node_locs[1]):
-                self.highlight_line(buffer.number, line_num)
-
-    def highlight_line(self, buffer_number: int, line_num: int) -> None:
-        self.nvim.funcs.nvim_buf_add_highlight(buffer_number, self.highlight_ns, "ErrorMsg", line_num, 0, -1)
-
-    def handle_uncertain_node_descendant(self, buffer, exp, last_sync):
-        # type:(Buffer, UncertainNodeChildrenException, LastSync) -> bool
-        self.nvim.command("set nowrite")
+        self.block_write_highlight_lines(buffer_number, exp.line_ranges)
+
+    def block_write_highlight_lines(self, buffer_number: int, line_ranges: Iterable[tuple[int, int]]) -> None:
+        # One extmark per line range, sent along with nowrite in a single request
+        _results, error = self.nvim.api.call_atomic([['nvim_command', ["set nowrite"]]] + [
+            ['nvim_buf_set_extmark', [buffer_number, self.highlight_ns, start_line_num, 0,
+                                      {'end_row': end_line_num, 'end_col': 0, 'hl_group': "ErrorMsg"}]]
+            for start_line_num, end_line_num in line_ranges])
+        if error is not None:
+            raise NvimError(str(error))
+
+    def handle_uncertain_node_descendant(self, buffer_number, exp, last_sync):
+        # type:(int, UncertainNodeChildrenException, LastSync) -> bool
         start_line_num, end_line_num = exp.line_range
-        for line_num in range(start_line_num, min(end_line_num, start_line_num + 50)):
-            self.highlight_line(buffer.number, line_num)
+        self.block_write_highlight_lines(buffer_number, [(start_line_num, min(end_line_num, start_line_num + 50))])
         choice = self.nvim.funcs.confirm("Uncertain state", "&Pause parsing\n&Continue", 1)
         if choice == 2:
             last_sync.pop_data(exp.node_id)
@@ -134,30 +178,36 @@ class PluginUtils:
             return False
 
     def delete_highlights(self, buffer_numer) -> None:
-        self.nvim.funcs.nvim_buf_clear_namespace(buffer_numer, self.highlight_ns, 0, -1)
+        self.nvim.api.buf_clear_namespace(buffer_numer, self.highlight_ns, 0, -1)
 
     def view_node_path(self, line_num: int, max_path_length: float) -> list[LineInfo]:
         buffer_id = self.current_buffer_id()
         assert buffer_id is not None and max_path_length > 0
-        line_data = self.buffer_last_sync[buffer_id].line_info
+        buffer_state = self.buffer_states.get(buffer_id)
+        last_sync = buffer_state.last_sync if buffer_state is not None else None
 
-        error_msg = f"Line info not found {self.buffer_last_sync=} {line_data=} {line_num=} {buffer_id=} {max_path_length}"
-        if line_data is None:
-            raise Exception(error_msg)
+        requested_path_length = max_path_length
+
+        def error_msg() -> str:
+            # Formatted only on failure since it reprs every buffer's sync state
+            return (f"Line info not found {self.buffer_states=} {last_sync=} {line_num=} {buffer_id=} "
+                    f"{requested_path_length}")
+
+        if last_sync is None:
+            raise Exception(error_msg())
 
         node_path = []
         last_level = float("inf")
-        for line_number in range(line_num, -1, -1):
-            if line_number in line_data:
-                cur_level = line_data[line_number].nested_level
-                if cur_level < last_level:
-                    node_path.append(line_data[line_number])
-                    last_level = cur_level
-                    max_path_length -= 1
-                    if max_path_length == 0:
-                        break
-
-        assert max_path_length == 0, (node_path, error_msg)
+        for cur_line_info in last_sync.reversed_line_infos(line_num):
+            cur_level = cur_line_info.nested_level
+            if cur_level < last_level:
+                node_path.append(cur_line_info)
+                last_level = cur_level
+                max_path_length -= 1
+                if max_path_length == 0:
+                    break
+
+        assert max_path_length == 0, (node_path, error_msg())
 
         return node_path
 
@@ -174,47 +224,44 @@ class PluginUtils:
         return view
 
     def should_continue(self, force: bool) -> bool:
-        in_normal_mode = self.nvim.funcs.mode() == 'n'
         if not force and self.ide_debugging:
             sleep(0.1)
-            if not in_normal_mode:
-                return False
+        try:
+            snapshot = self.editor_snapshot()
+        except OSError as e:  # Might happen while debugging with Pycharm
+            live_logger.critical(exception_traceback(e))
+            return False
 
-        if not (self.enabled and (force or in_normal_mode) and self.nvim.current.buffer.name.endswith(".q.md")):
+        in_normal_mode = snapshot['mode'] == 'n'
+        if not force and self.ide_debugging and not in_normal_mode:
             return False
 
-        undotree = self.nvim.funcs.undotree()
+        if not (self.enabled and (force or in_normal_mode) and snapshot['buffer_name'].endswith(".q.md")):
+            return False
+
+        undotree = snapshot['undotree']
 
         cur_undo_seq = undotree["seq_cur"]
 
         if (self.ide_debugging and undotree["synced"] == 0) or (cur_undo_seq < undotree["seq_last"]):
             return False
 
-        cur_buffer_id = self.current_buffer_id()
+        cur_buffer_id = self.current_buffer_id(snapshot)
         if cur_buffer_id is None:
             return False
-        if cur_buffer_id in self.undo_seq:
-            last_processed_undo_seq = self.undo_seq[cur_buffer_id]
-            if cur_undo_seq < last_processed_undo_seq or (cur_undo_seq == last_processed_undo_seq and not force):
-                return False
-            else:
-                for undo_entry in reversed(undotree['entries']):
-                    if cur_undo_seq in undo_entry:
-                        if 'alt' in undo_entry:
-                            self.buffer_last_sync.pop(cur_buffer_id)
-                        break
-        self.undo_seq[cur_buffer_id] = cur_undo_seq
-
-        # Undo changes changedtick so check that before to pop last_sync
-        try:
-            changedtick = self.nvim.eval("b:changedtick")
-        except OSError as e:
-            live_logger.critical(exception_traceback(e))
+        buffer_state = self.buffer_state(cur_buffer_id)
+        last_processed_undo_seq = buffer_state.undo_seq
+        if last_processed_undo_seq is not None and (
+                cur_undo_seq < last_processed_undo_seq or (cur_undo_seq == last_processed_undo_seq and not force)):
+            return False
+        buffer_state.undo_seq = cur_undo_seq
+
+        # Undo changes changedtick so check undo_seq before it
+        changedtick = snapshot['changedtick']
+        if not force and changedtick == buffer_state.changedtick:
+            return False
         else:
-            if not force and changedtick == self.changedtick[cur_buffer_id]:
-                return False
-            else:
-                self.changedtick[cur_buffer_id] = changedtick
+            buffer_state.changedtick = changedtick
 
         return True
 
@@ -222,8 +269,7 @@ class PluginUtils:
 
     def fzf_run(self, fzf_lines: list[str], query: str, ansi_escape_codes: bool) -> None:
         fzf_options = ['--delimiter', _FZF_LINE_DELIMITER, '--with-nth', '2..', '--query', query, '--preview',
-                       executable + " " + Path(__file__).parent.parent.joinpath('services/preview.py').as_posix()
-                       + " {1} 1", '--preview-window', ":wrap"]
+                       _FZF_PREVIEW_COMMAND, '--preview-window', ":wrap"]
         if ansi_escape_codes:
             fzf_options.append('--ansi')
         self.nvim.call("fzf#run", {'source': fzf_lines, 'sink': self.fzf_sink_command,
@@ -231,7 +277,7 @@ class PluginUtils:
 
     @staticmethod
     def file_path_transposed(file_path: str) -> bool:
-        return basename(file_path)[0] == _TRANSPOSED_FILE_PREFIX
+        return basename(file_path).startswith(_TRANSPOSED_FILE_PREFIX)
 
     @staticmethod
     def file_name_to_buffer_file_id(full_name: str, extension: str) -> FileId:
@@ -258,9 +304,9 @@ class PluginUtils:
     @staticmethod
     def filepath_node_id_transposed(file_path: str, db: MinimalDb) -> tuple[NodeId, bool]:
         file_name = basename(file_path)
-        transposed = PluginUtils.file_path_transposed(file_path)
+        transposed = file_name.startswith(_TRANSPOSED_FILE_PREFIX)
         if transposed:
-            file_name = file_name[1:]
+            file_name = file_name[len(_TRANSPOSED_FILE_PREFIX):]
 
         file_id = PluginUtils.file_name_to_buffer_file_id(file_name, ".q.md")
 
@@ -274,22 +320,27 @@ class PluginUtils:
 
     @staticmethod
     def node_id_filepath(node_id: NodeId, transposed: bool, db: MinimalDb) -> str:
-        file_name = (PluginUtils.node_id_to_buffer_file_id(node_id, db) if _SHORT_BUFFER_ID else node_id) + ".q.md"
-        if transposed:
-            file_name = _TRANSPOSED_FILE_PREFIX + file_name
-        return _FILE_FOLDER.joinpath(file_name).as_posix()
+        file_id = PluginUtils.node_id_to_buffer_file_id(node_id, db) if _SHORT_BUFFER_ID else node_id
+        return _file_id_filepath(file_id, transposed)
+
+
+@lru_cache(maxsize=4096)
+def _file_id_filepath(file_id: str, transposed: bool) -> str:
+    # Keyed on file id since the short buffer id still needs a db lookup
+    return _FILE_FOLDER.joinpath((_TRANSPOSED_FILE_PREFIX if transposed else '') + file_id + ".q.md").as_posix()
 
 
 def get_orphan_node_ids(db: Database) -> list[NodeId]:
     root_id = db.get_root_id()
     visited_node_ids = {root_id}
 
-    node_stack = [root_id]
-    while node_stack:
-        node_id = node_stack.pop()
-        node_children_ids = db.get_node_descendants(node_id, False, True)
-        if node_children_ids:
-            node_stack.extend((child_id for child_id in node_children_ids if child_id not in visited_node_ids))
-            visited_node_ids.update(node_children_ids)
-    orphan_node_ids = [node_id for node_id in db.get_node_ids() if node_id not in visited_node_ids]
+    # Level at a time so that each level's children are read in one key ordered batch
+    frontier_node_ids = [root_id]
+    while frontier_node_ids:
+        children_ids = chain.from_iterable(db.get_nodes_descendants(frontier_node_ids, False, True))
+        unvisited_children_ids = set(children_ids).difference(visited_node_ids)
+        visited_node_ids |= unvisited_children_ids
+        frontier_node_ids = list(unvisited_children_ids)
+    # Sorted to keep the db key order
+    orphan_node_ids = sorted(set(db.get_node_ids()).difference(visited_node_ids))
     return orphan_node_ids